@@ -23,6 +23,8 @@ VERSION = "0.8"
 
 SIMULATE_ERRONEOUS_READING = False
 TEST_LOG_THREAD = False
+# evaluated once at import time, as it is checked within loops
+DEBUG_LOG_THREAD = __name__ == '__main__' and TEST_LOG_THREAD
 
 """
 
@@ -66,6 +68,9 @@ TEST_LOG_THREAD = False
     * The interruption is shorter than 10 minutes AND
     * the interruption is shorter than the duration of precipitation.
     
+    The `...History` observation type contains a snapshot of that list
+    as a tuple of tuples.
+    
     The WeeWX accumulator 'firstlast' as of version 4.10.2 converts
     all values to strings. So it is not suitable for lists.
     
@@ -73,12 +78,16 @@ TEST_LOG_THREAD = False
 
 import threading 
 import configobj
+import sys
 import time
-import copy
+import functools
+import operator
+import collections
 import json
-import select
+import selectors
 import socket
 import math
+import re
 import sqlite3
 import os.path
 import traceback
@@ -97,12 +106,12 @@ if __name__ == '__main__':
     import sys
     sys.path.append('/usr/share/weewx')
     
-    def logdbg(x):
-        print('DEBUG',x)
-    def loginf(x):
-        print('INFO',x)
-    def logerr(x):
-        print('ERROR',x)
+    def logdbg(x, *args):
+        print('DEBUG',x % args if args else x)
+    def loginf(x, *args):
+        print('INFO',x % args if args else x)
+    def logerr(x, *args):
+        print('ERROR',x % args if args else x)
 
 else:
 
@@ -112,14 +121,16 @@ else:
         import logging
         log = logging.getLogger("user.PrecipMeter")
 
-        def logdbg(msg):
-            log.debug(msg)
+        # Arguments are formatted by the logging module and only
+        # if the message is actually logged.
+        def logdbg(msg, *args):
+            log.debug(msg, *args)
 
-        def loginf(msg):
-            log.info(msg)
+        def loginf(msg, *args):
+            log.info(msg, *args)
 
-        def logerr(msg):
-            log.error(msg)
+        def logerr(msg, *args):
+            log.error(msg, *args)
 
     except ImportError:
         # Old-style weewx logging
@@ -128,14 +139,14 @@ else:
         def logmsg(level, msg):
             syslog.syslog(level, 'user.PrecipMeter: %s' % msg)
 
-        def logdbg(msg):
-            logmsg(syslog.LOG_DEBUG, msg)
+        def logdbg(msg, *args):
+            logmsg(syslog.LOG_DEBUG, msg % args if args else msg)
 
-        def loginf(msg):
-            logmsg(syslog.LOG_INFO, msg)
+        def loginf(msg, *args):
+            logmsg(syslog.LOG_INFO, msg % args if args else msg)
 
-        def logerr(msg):
-            logmsg(syslog.LOG_ERR, msg)
+        def logerr(msg, *args):
+            logmsg(syslog.LOG_ERR, msg % args if args else msg)
 
 def gettraceback(e):
     return ' - '.join(traceback.format_tb(e.__traceback__)).replace('\n',' ')
@@ -157,9 +168,34 @@ ACCUM_MAX = { 'extractor':'max' }
 ACCUM_NOOP = { 'accumulator':'firstlast','adder':'noop','extractor':'noop' }
 ACCUM_HISTORY = ACCUM_NOOP
 
+# unit groups and how to aggregate them in _process_data()
+AVG_GROUPS = frozenset(('group_temperature','group_db','group_distance','group_volt'))
+MAX_GROUPS = frozenset(('group_wmo_ww','group_wmo_wawa'))
+SUM_GROUPS = frozenset(('group_deltatime',))
+# observation types of which _process_data() keeps the last reading
+LAST_OBSTYPES = frozenset(('presentweatherWw','presentweatherWawa','presentweatherStart','presentweatherTime','precipitationStart'))
+
+# unit groups with readings of SQL datatype INTEGER
+INTEGER_GROUPS = frozenset(('group_count','group_wmo_ww','group_wmo_wawa','group_boolean'))
+
+# unit groups and the WeeWX accumulator to use for them
+ACCUM_LAST_GROUPS = frozenset(('group_deltatime','group_elapsed','group_time','group_count'))
+ACCUM_NOOP_GROUPS = frozenset(('group_wmo_ww','group_wmo_wawa'))
+
+# fallback for missing configuration sections (read only)
+EMPTY_CONF = dict()
+
+# keys of the collected data that are not readings
+SKIP_KEYS = frozenset(('time','interval','count'))
+
+# description of one field of the data telegram as created by
+# PrecipData._create_thread()
+TelegramField = collections.namedtuple('TelegramField',
+    'nr desc size fmt obstype unit group datatype')
+
 # Initialize default unit for the unit groups defined in this extension
 
-for _,ii in weewx.units.std_groups.items():
+for ii in weewx.units.std_groups.values():
     ii.setdefault('group_wmo_ww','byte')
     ii.setdefault('group_wmo_wawa','byte')
     ii.setdefault('group_wmo_W','byte')
@@ -175,35 +211,28 @@ weewx.units.agg_group.setdefault('wmo_Wa2','group_wmo_Wa')
 
 # Additional unit conversion formulae
 
-weewx.defaults.defaults['Units']['StringFormats'].setdefault('millivolt',"%.0f")
-weewx.defaults.defaults['Units']['Labels'].setdefault('millivolt',u" mV")
-weewx.defaults.defaults['Units']['StringFormats'].setdefault('decivolt',"%.1f")
-weewx.defaults.defaults['Units']['Labels'].setdefault('decivolt',u" dV")
-weewx.defaults.defaults['Units']['StringFormats'].setdefault('milliamp',"%.0f")
-weewx.defaults.defaults['Units']['Labels'].setdefault('milliamp',u" mA")
+for unit,string_format,label in (('millivolt',"%.0f",u" mV"),
+                                 ('decivolt', "%.1f",u" dV"),
+                                 ('milliamp', "%.0f",u" mA")):
+    weewx.defaults.defaults['Units']['StringFormats'].setdefault(unit,string_format)
+    weewx.defaults.defaults['Units']['Labels'].setdefault(unit,label)
 
+# The conversions are simple multiplications. functools.partial() of
+# operator.mul avoids a Python function call for each conversion.
 MILE_PER_METER = 1.0/weewx.units.METER_PER_MILE
-weewx.units.conversionDict['meter'].setdefault('mile',lambda x: x*MILE_PER_METER)
-
-if 'volt' not in weewx.units.conversionDict:
-    weewx.units.conversionDict['volt'] = {}
-weewx.units.conversionDict['volt'].setdefault('millivolt',lambda x: x*0.001)
-weewx.units.conversionDict['volt'].setdefault('decivolt',lambda x: x*0.1)
-if 'millivolt' not in weewx.units.conversionDict:
-    weewx.units.conversionDict['millivolt'] = {}
-weewx.units.conversionDict['millivolt'].setdefault('volt',lambda x: x*1000)
-weewx.units.conversionDict['millivolt'].setdefault('decivolt',lambda x: x*0.01)
-if 'decivolt' not in weewx.units.conversionDict:
-    weewx.units.conversionDict['decivolt'] = {}
-weewx.units.conversionDict['decivolt'].setdefault('volt',lambda x: x*0.1)
-weewx.units.conversionDict['decivolt'].setdefault('millivolt',lambda x: x*100)
-
-if 'amp' not in weewx.units.conversionDict:
-    weewx.units.conversionDict['amp'] = {}
-weewx.units.conversionDict['amp'].setdefault('milliamp',lambda x: x*1000)
-if 'milliamp' not in weewx.units.conversionDict:
-    weewx.units.conversionDict['milliamp'] = {}
-weewx.units.conversionDict['milliamp'].setdefault('amp',lambda x: x*0.001)
+UNIT_CONVERSION_FACTORS = {
+    ('meter','mile'):          MILE_PER_METER,
+    ('volt','millivolt'):      1000.0,
+    ('volt','decivolt'):       10.0,
+    ('millivolt','volt'):      0.001,
+    ('millivolt','decivolt'):  0.01,
+    ('decivolt','volt'):       0.1,
+    ('decivolt','millivolt'):  100.0,
+    ('amp','milliamp'):        1000.0,
+    ('milliamp','amp'):        0.001
+}
+for (from_unit,to_unit),factor in UNIT_CONVERSION_FACTORS.items():
+    weewx.units.conversionDict.setdefault(from_unit,dict()).setdefault(to_unit,functools.partial(operator.mul,factor))
 
 
 ##############################################################################
@@ -265,6 +294,11 @@ PARSIVEL = [
   (93,'Rohdaten',4095,'000S','raw','count','group_count')
 ]
 
+PARSIVEL_BY_NR = { jj[0]:jj for jj in PARSIVEL }
+
+# start of text character at the beginning of the Thies telegram
+STX = '\x02'
+
 THIES_READINGS = [
   #Nr,Beschreibung,Stellen,Form,Größe,Einheit,Gruppe
   # 1 STX
@@ -359,9 +393,12 @@ THIES_INTERNAL = [
   (79,'Partikelanzahl Klasse 9',5,'NNNNN',None,'count','group_count'),
   (80,'Gesamtvolumen (brutto) Klasse 9',9,'',None,None,None),
 ]
-THIES_RAW = [
-  (ii+81,'Niederschlagssprektrum',3,'NNN','raw%04d' % ii,'count','group_count') for ii in range(440)
-]
+# The raw data spectrum has 440 fields. It is created on demand only.
+@functools.lru_cache(maxsize=1)
+def thies_raw():
+    return [
+      (ii+81,'Niederschlagssprektrum',3,'NNN','raw%04d' % ii,'count','group_count') for ii in range(440)
+    ]
 THIES_AUX = [
   (521,'Temperatur',5,'NNN.N','outTemp','degree_C','group_temperature'),
   (522,'relative Luftfeuchte',5,'NNN.N','outHumidity','percent','group_percent'),
@@ -389,17 +426,18 @@ THIES_CHKSUM = [
   # 526 CRLF
   # 527 ETX
 ]
+# field list of the Thies telegrams (call the value to get the list)
 THIES = {
-  4:THIES_READINGS + THIES_STATE + THIES_INTERNAL + THIES_RAW + THIES_CHKSUM,
-  5:THIES_READINGS + THIES_STATE + THIES_INTERNAL + THIES_RAW + THIES_AUX + THIES_CHKSUM,
-  6:THIES_READINGS + THIES_STATE + THIES_CHKSUM,
-  7:THIES_READINGS + THIES_STATE + THIES_AUX + THIES_CHKSUM,
-  8:THIES_READINGS + THIES_CHKSUM,
-  9:THIES_READINGS + THIES_AUX + THIES_CHKSUM,
-  10:THIES_READINGS + THIES_STATE + THIES_AUX + THIES_AVG_4680 + THIES_CHKSUM
+  4:lambda: THIES_READINGS + THIES_STATE + THIES_INTERNAL + thies_raw() + THIES_CHKSUM,
+  5:lambda: THIES_READINGS + THIES_STATE + THIES_INTERNAL + thies_raw() + THIES_AUX + THIES_CHKSUM,
+  6:lambda: THIES_READINGS + THIES_STATE + THIES_CHKSUM,
+  7:lambda: THIES_READINGS + THIES_STATE + THIES_AUX + THIES_CHKSUM,
+  8:lambda: THIES_READINGS + THIES_CHKSUM,
+  9:lambda: THIES_READINGS + THIES_AUX + THIES_CHKSUM,
+  10:lambda: THIES_READINGS + THIES_STATE + THIES_AUX + THIES_AVG_4680 + THIES_CHKSUM
 }
 
-#for ii in THIES: print(ii,sum([jj[2]+1 for jj in THIES[ii]])+4)
+#for ii in THIES: print(ii,sum([jj[2]+1 for jj in THIES[ii]()])+4)
 
 # "state after something" weather codes
 
@@ -607,6 +645,26 @@ WA_WW = [
 WA_WAWA_REVERSED = { i:j for j,k in enumerate(WA_WAWA) for i in k }
 WA_WW_REVERSED = { i:j for j,k in enumerate(WA_WW) for i in k }
 
+# drizzle and rain codes if it is freezing
+
+WW_FREEZING = {
+    56:(50,51), # freezing drizzle, light
+    57:(52,53,54,55), # freezing drizzle, moderate or heavy
+    66:(58,60,61), # freezing rain, light
+    67:(59,62,63,64,65) # freezing rain, moderate or heavy
+}
+WAWA_FREEZING = {
+    54:(51,), # freezing drizzle, light
+    55:(52,), # freezing drizzle, moderate
+    56:(53,), # freezing drizzle, heavy
+    64:(57,61), # freezing rain, light
+    65:(62,), # freezing rain, moderate
+    66:(58,63) # freezing rain, heavy
+}
+
+WW_FREEZING_REVERSED = { i:j for j,k in WW_FREEZING.items() for i in k }
+WAWA_FREEZING_REVERSED = { i:j for j,k in WAWA_FREEZING.items() for i in k }
+
 # ww to AWEKAS code
 WW_AWEKAS = {
    0: 0,
@@ -739,11 +797,15 @@ AWEKAS = [
     ('starke Schneeschauer','heavy snow showers',19,'snow.png')
 ]
 
+# housing temperature of the simulator, one value per second of a 30 s cycle
+
+SIMULATOR_TEMP = tuple(int(round(25+2*math.sin(ii/30*math.pi),0)) for ii in range(30))
+
 ##############################################################################
 #    Database schema                                                         #
 ##############################################################################
 
-exclude_from_summary = ['dateTime', 'usUnits', 'interval','presentweatherTime']
+exclude_from_summary = frozenset(('dateTime', 'usUnits', 'interval','presentweatherTime'))
 
 table = [
     ('dateTime',             'INTEGER NOT NULL UNIQUE PRIMARY KEY'),
@@ -789,13 +851,57 @@ weatherconditionschema = {
     'day_summaries': []
 }
 
+# SQL statements of the thread present weather database
+
+SQL_INSERT_PRECIPITATION = 'INSERT INTO precipitation VALUES (?,?,?,?,?,?,?,?)'
+SQL_DELETE_PRECIPITATION = 'DELETE FROM precipitation WHERE `start`=?'
+
+# SQL string datatypes
+
+SQL_TEXT_TYPES = frozenset(('TEXT','CLOB','CHARACTER','VARCHAR','VARYING CHARACTER','NCHAR','NATIVE CHARACTER','NVARCHAR'))
+
 ##############################################################################
 
 def issqltexttype(x):
     """ Is this a string type in SQL? """
     if x is None: return None
     x = x.upper().split('(')[0].strip()
-    return x in ('TEXT','CLOB','CHARACTER','VARCHAR','VARYING CHARACTER','NCHAR','NATIVE CHARACTER','NVARCHAR')
+    return x in SQL_TEXT_TYPES
+
+def unit_to_group():
+    """ Reverse lookup table unit to unit group 
+    
+        METRIC takes precedence over US. The table is built when 
+        needed, so that units registered by other extensions after 
+        this module was imported are included.
+    """
+    table = dict()
+    for units in (weewx.units.MetricUnits,weewx.units.USUnits):
+        for group,unit in units.items():
+            table.setdefault(unit,group)
+    return table
+
+@functools.lru_cache(maxsize=32)
+def resolve_host(host):
+    """ Get the IPv4 address of `host`. A numeric address is returned
+        without asking the resolver. 
+    """
+    try:
+        return socket.getaddrinfo(host,None,family=socket.AF_INET,flags=socket.AI_NUMERICHOST)[0][4][0]
+    except socket.gaierror:
+        return socket.gethostbyname(host)
+
+def get_conversion(val_t, usUnits):
+    """ Get the function to convert a value of the unit of `val_t` to the
+        unit system `usUnits`. None if no conversion is necessary or
+        possible.
+    """
+    try:
+        target_unit = weewx.units.convertStd((None,val_t[1],val_t[2]),usUnits)[1]
+        if target_unit==val_t[1]: return None
+        return weewx.units.conversionDict[val_t[1]][target_unit]
+    except (LookupError,ValueError,TypeError):
+        return None
 
 def is_ww_wawa_precipitation(ww, wawa):
     """ Does this weather code mean precipitation? """
@@ -879,14 +985,8 @@ def get_w1w2_from_ww(ww_list):
     # the past weather.
     w = sorted(set(w_list[1:]),key=lambda x:-1 if x is None else x)
     if not w: return w_list[0],None,None
-    try:
-        w1 = w[-1]
-    except (LookupError,TypeError):
-        w1 = None
-    try:
-        w2 = w[-2]
-    except LookupError:
-        w2 = None
+    w1 = w[-1]
+    w2 = w[-2] if len(w)>1 else None
     return w_list[0], w1, w2
 
 def max_wawa(wawa_list):
@@ -928,14 +1028,8 @@ def get_wa1wa2_from_wawa_or_ww(ww_list,obsgroup):
     # the past weather.
     w = sorted(set(w_list[1:]),key=lambda x:-1 if x is None else x)
     if not w: return w_list[0],None,None
-    try:
-        w1 = w[-1]
-    except (LookupError,TypeError):
-        w1 = None
-    try:
-        w2 = w[-2]
-    except LookupError:
-        w2 = None
+    w1 = w[-1]
+    w2 = w[-2] if len(w)>1 else None
     return w_list[0], w1, w2
 
 ##############################################################################
@@ -968,14 +1062,14 @@ class PrecipXType(weewx.xtypes.XType):
         """ get most significant ww code of the timespan """
         start,stop,data = weewx.xtypes.get_series(obs_type,timespan,db_manager,**option_dict)
         ww = max_ww(data[0])
-        logdbg('get_ww_max %s' % ww)
+        logdbg('get_ww_max %s', ww)
         return weewx.units.ValueTuple(ww,'byte','group_wmo_ww')
             
     def get_wawa_max(self, obs_type, timespan, db_manager, **option_dict):
         """ get most significant wawa code of the timespan """
         start,stop,data = weewx.xtypes.get_series(obs_type,timespan,db_manager,**option_dict)
         wawa = max_wawa(data[0])
-        logdbg('get_wawa_max %s' % wawa)
+        logdbg('get_wawa_max %s', wawa)
         return weewx.units.ValueTuple(wawa,'byte','group_wmo_wawa')
         
     def get_w(self, obs_type, timespan, agg_type,db_manager, **option_dict):
@@ -1020,13 +1114,44 @@ class PrecipThread(threading.Thread):
         self.telegram_list = conf_dict['loop']
         self.field_separator = conf_dict.get('field_separator',';')
         self.record_separator = conf_dict.get('record_separator','\r\n')
+        # separators to check raw data before decoding them
+        self.field_separator_bytes = self.field_separator.encode('ascii',errors='ignore')
+        self.record_separator_bytes = self.record_separator.encode('ascii',errors='ignore')
         self.model = conf_dict.get('model','Ott-Parsivel2').lower()
+        self.is_parsivel = self.model.startswith('ott-parsivel')
+        self.is_thies = self.model=='thies-lnm'
+        # telegram parser for the model
+        if self.is_parsivel or self.is_thies or self.model=='generic':
+            self.parse_reply = self.parse_fields
+        else:
+            self.parse_reply = self.parse_unknown
         self.set_weathercodes = conf_dict.get('weathercodes',name)==name
         self.set_visibility = conf_dict.get('visibility',name)==name
         self.set_precipitation = conf_dict.get('precipitation','-----')==name
         self.set_rainDur = conf_dict.get('rainDur','-----')==name
         self.set_awekas = name in weeutil.weeutil.option_as_list(conf_dict.get('AWEKAS',[]))
         self.prefix = conf_dict.get('prefix')
+        # observation types that depend on the prefix and are set for
+        # every telegram
+        if self.prefix:
+            self.rain_obstype = self.prefix+'Rain'
+            self.rainrate_obstype = self.prefix+'RainRate'
+            self.raindur_obstype = self.prefix+'RainDur'
+            self.mor_obstype = self.prefix+'MOR'
+            self.history_obstype = self.prefix+'History'
+        else:
+            self.rain_obstype = None
+            self.rainrate_obstype = None
+            self.raindur_obstype = None
+            self.mor_obstype = None
+            self.history_obstype = None
+        # optional list of CPU numbers the thread is bound to (Linux only)
+        try:
+            self.affinity = set(weeutil.weeutil.to_int(ii) for ii in weeutil.weeutil.option_as_list(conf_dict.get('affinity',[])))
+            self.affinity.discard(None)
+        except (TypeError,ValueError) as e:
+            logerr("thread '%s': invalid affinity %s: %s %s",name,conf_dict.get('affinity'),e.__class__.__name__,e)
+            self.affinity = set()
         # Precipitation or non-precipitation conditions lasting
         # less than self.error_limit are considered erroneous.
         self.error_limit = conf_dict.get('error_limit',60) # seconds
@@ -1056,8 +1181,11 @@ class PrecipThread(threading.Thread):
         except FileNotFoundError:
             pass
         # delete outdated elements
-        while len(self.presentweather_list)>0 and self.presentweather_list[0][1]<(time.time()-3600):
-            del self.presentweather_list[0]
+        # (The list is sorted by time, so one slice operation is
+        # sufficient.)
+        cutoff = time.time()-3600
+        idx = next((idx for idx,ii in enumerate(self.presentweather_list) if ii[1]>=cutoff),len(self.presentweather_list))
+        if idx: del self.presentweather_list[:idx]
         
         self.next_obs_errors = dict()
         self.last_rain = None
@@ -1065,13 +1193,23 @@ class PrecipThread(threading.Thread):
         
         self.file = None
         self.socket = None
+        # The socket is registered with the selector while it is open.
+        self.selector = selectors.DefaultSelector()
+        self.rx_buffer = bytearray()
+        # receive buffer for socket connections
+        self.rx_chunk = bytearray(8192)
+        self.rx_view = memoryview(self.rx_chunk)
         # udp tcp restful usb none
         self.connection_type = conf_dict.get('type','none').lower()
         host = conf_dict.get('host')
         if host and self.connection_type in ('udp','tcp'): 
-            host = socket.gethostbyname(host)
+            host = resolve_host(host)
         self.host = host
-        self.port = int(conf_dict.get('port'))
+        if self.connection_type=='usb':
+            # device file name
+            self.port = conf_dict.get('port')
+        else:
+            self.port = int(conf_dict.get('port'))
         
         self.running = True
         self.evt = threading.Event()
@@ -1129,6 +1267,8 @@ class PrecipThread(threading.Thread):
                 self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_STREAM | socket.SOCK_CLOEXEC)
                 #select.select([self.socket],[self.socket],[self.socket])
                 self.socket.connect((self.host,self.port))
+            if self.socket:
+                self.selector.register(self.socket,selectors.EVENT_READ)
             self.last_data_ts = time.time()+120
         except OSError as e:
             logerr("thread '%s': opening connection to %s:%s failed with %s %s, will be tried again" % (self.name,self.host,self.port,e.__class__.__name__,e))
@@ -1140,12 +1280,18 @@ class PrecipThread(threading.Thread):
     def socket_close(self):
         """ Close connection to the device. """
         if self.socket:
+            try:
+                self.selector.unregister(self.socket)
+            except (KeyError,ValueError):
+                pass
             try:
                 self.socket.close()
             except OSError as e:
                 logerr("thread '%s': closing connection to %s:%s failed with %s %s",self.name,self.host,self.port,e.__class__.__name__,e)
             finally:
                 self.socket = None
+                # Data of the closed connection are of no use anymore.
+                self.rx_buffer.clear()
     
     def db_open(self):
         """ Open thread present weather database. """
@@ -1155,15 +1301,26 @@ class PrecipThread(threading.Thread):
                 timeout=self.db_timeout
             )
             cur = self.db_conn.cursor()
+            # The database is written by this thread and read by WeeWX
+            # at the same time. In WAL mode readers do not block the
+            # writer and vice versa, and synchronous=NORMAL is safe
+            # with WAL while it saves one fsync per commit.
+            cur.execute('PRAGMA journal_mode=WAL')
+            cur.execute('PRAGMA synchronous=NORMAL')
             reply = cur.execute('SELECT name FROM sqlite_master')
             rec = reply.fetchall()
             if rec and 'precipitation' in [ii[0] for ii in rec]:
+                # Note: presentweather_list is not reloaded from here.
+                # The table lacks the running sums of the list elements.
+                # The list is restored from the json file in __init__().
                 pass
-                #reply = cur.execute('SELECT * FROM precipitation WHERE `start`>%d' % (time.time()-3600))
-                #self.presentweather_list = reply.fetchall()
             else:
                 cur.execute('CREATE TABLE precipitation(`start` INTEGER NOT NULL UNIQUE PRIMARY KEY,`stop` INTEGER NOT NULL,`ww` INTEGER,`wawa` INTEGER,`precipstart` INTEGER,`METAR` VARCHAR(5),`rainRate` REAL,`rain` REAL)')
-                cur.execute('CREATE VIEW archive(`dateTime`,`usUnits`,`interval`,`presentweatherStart`,`precipitationStart`,`presentweatherTime`,`ww`,`wawa`,`METAR`,`rainRate`,`rain`) AS SELECT stop,17,(stop-start)/60,start,precipstart,stop-start,ww,wawa,METAR,rainRate,rain from precipitation order by stop')
+                cur.execute('CREATE VIEW archive(`dateTime`,`usUnits`,`interval`,`presentweatherStart`,`precipitationStart`,`presentweatherTime`,`ww`,`wawa`,`METAR`,`rainRate`,`rain`) AS SELECT stop,17,(stop-start)/60,start,precipstart,stop-start,ww,wawa,METAR,rainRate,rain from precipitation')
+            # `dateTime` of the archive view is `stop`. Readers select
+            # time ranges and sort by it themselves, so an index
+            # serves them better than sorting the whole view.
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_precipitation_stop ON precipitation(`stop`)')
             self.db_conn.commit()
             cur.close()
         except sqlite3.Error as e:
@@ -1232,16 +1389,22 @@ class PrecipThread(threading.Thread):
                 if ((last_el[1]-last_el[0])<=max(self.device_interval,self.error_limit) and
                     (wawa is not None or ww is not None)):
                     # The last value appears only once.
-                    if (
+                    prev_is_precip = PrecipThread.is_el_precip(prev_el)
+                    last_is_precip = PrecipThread.is_el_precip(last_el)
+                    if not last_is_precip and not is_precipitation:
+                        # Nothing to check if neither the last nor the
+                        # actual reading is precipitation.
+                        pass
+                    elif (
                         (
-                            PrecipThread.is_el_precip(prev_el) and 
+                            prev_is_precip and 
                             is_precipitation and 
-                            not PrecipThread.is_el_precip(last_el)
+                            not last_is_precip
                         ) or
                         (
-                            not PrecipThread.is_el_precip(prev_el) and 
+                            not prev_is_precip and 
                             not is_precipitation and 
-                            PrecipThread.is_el_precip(last_el)
+                            last_is_precip
                             and last_el[2]!=71 and last_el[3]!=71
                         )
                     ):
@@ -1263,15 +1426,13 @@ class PrecipThread(threading.Thread):
                             # and active element now) may be marked as
                             # short precipitation interruption. Remove
                             # that mark.
-                            if not PrecipThread.is_el_precip(self.presentweather_list[-1]):
+                            if not prev_is_precip:
                                 self.presentweather_list[-1][4] = None
                             # Now remove the last row from the database,
                             # as this is the active row again.
                             try:
-                                cur = self.db_conn.cursor()
-                                cur.execute('DELETE FROM precipitation WHERE `start`=?',tuple((self.presentweather_list[-1][0],)))
+                                self.db_conn.execute(SQL_DELETE_PRECIPITATION,(self.presentweather_list[-1][0],))
                                 self.db_conn.commit()
-                                cur.close()
                             except sqlite3.Error as e:
                                 logerr("thread '%s': SQLITE DELETE %s %s" % (self.name,e.__class__.__name__,e))
                             except LookupError:
@@ -1291,8 +1452,8 @@ class PrecipThread(threading.Thread):
                             last_el[8] = p_rate
                             last_el[9] = 1
                             last_el[10] = p_abs
-                    elif (PrecipThread.is_el_precip(prev_el) and
-                          PrecipThread.is_el_precip(last_el) and
+                    elif (prev_is_precip and
+                          last_is_precip and
                           is_precipitation):
                         # 3 different elements of precipitation
                         if (prev_el[2] is not None and 
@@ -1342,10 +1503,8 @@ class PrecipThread(threading.Thread):
                             # Now remove the last row from the database,
                             # as this is the active row again.
                             try:
-                                cur = self.db_conn.cursor()
-                                cur.execute('DELETE FROM precipitation WHERE `start`=?',tuple((self.presentweather_list[-1][0],)))
+                                self.db_conn.execute(SQL_DELETE_PRECIPITATION,(self.presentweather_list[-1][0],))
                                 self.db_conn.commit()
-                                cur.close()
                             except sqlite3.Error as e:
                                 logerr("thread '%s': SQLITE DELETE %s %s" % (self.name,e.__class__.__name__,e))
                             except LookupError:
@@ -1395,10 +1554,9 @@ class PrecipThread(threading.Thread):
                     p_amount = None
                 # save the last element to the database
                 try:
-                    cur = self.db_conn.cursor()
-                    cur.execute('INSERT INTO precipitation VALUES (?,?,?,?,?,?,?,?)',tuple(self.presentweather_list[-1][:6]+[p_rate_avg,p_amount]))
+                    el = self.presentweather_list[-1]
+                    self.db_conn.execute(SQL_INSERT_PRECIPITATION,(el[0],el[1],el[2],el[3],el[4],el[5],p_rate_avg,p_amount))
                     self.db_conn.commit()
-                    cur.close()
                 except sqlite3.Error as e:
                     logerr("thread '%s': SQLITE INSERT %s %s" % (self.name,e.__class__.__name__,e))
                 except LookupError:
@@ -1437,7 +1595,7 @@ class PrecipThread(threading.Thread):
         if self.presentweather_list[0][1]<(ts-3600):
             self.presentweather_list.pop(0)
         # Now we have a list of the weather codes of the last hour.
-        if __name__ == '__main__' and TEST_LOG_THREAD:
+        if DEBUG_LOG_THREAD:
             print('presentweather_list',self.presentweather_list)
         return precipstart
     
@@ -1468,14 +1626,14 @@ class PrecipThread(threading.Thread):
                         # compensate for the previously reported
                         # rain duration, now considered erroneous
                         rec = {
-                            self.prefix+'RainDur':(
+                            self.raindur_obstype:(
                                 -precip_duration,
                                 'second',
                                 'group_deltatime'
                             )
                         }
                         if self.set_rainDur:
-                            rec['rainDur'] = rec[self.prefix+'RainDur']
+                            rec['rainDur'] = rec[self.raindur_obstype]
                         self.put_data(ts,rec)
                         #print('negative rainDur')
                     precipstart = last_el[4]
@@ -1485,10 +1643,8 @@ class PrecipThread(threading.Thread):
                         loginf("thread '%s': discarded ww/wawa/w'w' %s/%s/%s lasting %s seconds" % (self.name,last_el[2],last_el[3],last_el[5],last_el[1]-last_el[0]))
                         # remove the element from database
                         try:
-                            cur = self.db_conn.cursor()
-                            cur.execute('DELETE FROM precipitation WHERE `start`=?',tuple((last_el[0],)))
+                            self.db_conn.execute(SQL_DELETE_PRECIPITATION,(last_el[0],))
                             self.db_conn.commit()
-                            cur.close()
                         except sqlite3.Error as e:
                             logerr("thread '%s': SQLITE DELETE %s %s" % (self.name,e.__class__.__name__,e))
                         except LookupError:
@@ -1514,10 +1670,8 @@ class PrecipThread(threading.Thread):
                         # this is the new active element, and
                         # the active element is in memory only.
                         try:
-                            cur = self.db_conn.cursor()
-                            cur.execute('DELETE FROM precipitation WHERE `start`=?',tuple((last_el[0],)))
+                            self.db_conn.execute(SQL_DELETE_PRECIPITATION,(last_el[0],))
                             self.db_conn.commit()
-                            cur.close()
                         except sqlite3.Error as e:
                             logerr("thread '%s': SQLITE DELETE %s %s" % (self.name,e.__class__.__name__,e))
                         except LookupError:
@@ -1575,27 +1729,36 @@ class PrecipThread(threading.Thread):
         weather2x = None
         duration2x = ((None,None),(None,None))
         Wa_list = [0]*10
+        # lookup functions used within the loop
+        ww_type_get = WW_TYPE_REVERSED.get
+        wawa_type_get = WAWA_TYPE_REVERSED.get
+        ww_intensity_get = WW_INTENSITY_REVERSED.get
+        wawa_intensity_get = WAWA_INTENSITY_REVERSED.get
+        ww2_get = WW2_REVERSED.get
+        wawa2_get = WAWA2_REVERSED.get
         try:
-            dur_dict = {'ww':dict(), 'wawa':dict(), 'metar':dict()}
+            dur_dict = {'ww':{}, 'wawa':{}, 'metar':{}}
             for idx,ii in enumerate(self.presentweather_list):
                 if ts and ii[0]>ts:
                     break
-                if __name__ == '__main__' and TEST_LOG_THREAD:
+                if DEBUG_LOG_THREAD:
                     print('idx',idx,'ii',ii)
                 duration = ii[1]-ii[0]
                 ww = ii[2]
                 wawa = ii[3]
                 # get weather type 
-                wwtype1 = WW_TYPE_REVERSED.get(ii[2],ii[2]) 
-                wawatype1 = WAWA_TYPE_REVERSED.get(ii[3],ii[3]) 
+                wwtype1 = ww_type_get(ww,ww) 
+                wawatype1 = wawa_type_get(wawa,wawa) 
                 # compare to the weather type of the previous timespan
                 if wwtype1!=wwtype or wawatype1!=wawatype:
                     # weather type changed
                     wwtype = wwtype1
                     wawatype = wawatype1
                     start = ii[0]
-                #
-                if PrecipThread.is_el_precip(ii):
+                # (The row does not change within this loop, so the
+                # result can be reused below.)
+                is_precip = is_ww_wawa_precipitation(ww,wawa)
+                if is_precip:
                     precip_duration += duration
                 #
                 if ii[4]:
@@ -1621,13 +1784,13 @@ class PrecipThread(threading.Thread):
                     # the sums.
                     ii[7] = dursum
                     ii[6] = intsum
-                    if PrecipThread.is_el_precip(ii):
+                    if is_precip:
                         # Short interruptions of precipitation are not included
                         # in the intensity average.
-                        if ii[2] is not None:
-                            intensity = WW_INTENSITY_REVERSED.get(ii[2],0)
-                        elif ii[3] is not None:
-                            intensity = WAWA_INTENSITY_REVERSED.get(ii[3],0)
+                        if ww is not None:
+                            intensity = ww_intensity_get(ww,0)
+                        elif wawa is not None:
+                            intensity = wawa_intensity_get(wawa,0)
                         else:
                             intensity = 0
                         dursum += duration
@@ -1635,8 +1798,8 @@ class PrecipThread(threading.Thread):
                         weather2x = ii
                         # prepare determining "state after precipition"
                         # weather code
-                        ww2 = WW2_REVERSED.get(ii[2],ii[2])
-                        wawa2 = WAWA2_REVERSED.get(ii[3],ii[3])
+                        ww2 = ww2_get(ww,ww)
+                        wawa2 = wawa2_get(wawa,wawa)
                         try:
                             metar2 = ii[5].replace('+','').replace('-','')
                         except AttributeError:
@@ -1644,7 +1807,7 @@ class PrecipThread(threading.Thread):
                         dur_dict['ww'][ww2] = dur_dict['ww'].get(ww2,0)+duration
                         dur_dict['wawa'][wawa2] = dur_dict['wawa'].get(wawa2,0)+duration
                         dur_dict['metar'][metar2] = dur_dict['metar'].get(metar2,0)+duration
-                        if __name__=='__main__' and TEST_LOG_THREAD:
+                        if DEBUG_LOG_THREAD:
                             print('     ','dur_dict',dur_dict)
                 else:
                     # No precipitation and no short interruption of 
@@ -1717,10 +1880,10 @@ class PrecipThread(threading.Thread):
                             # freezing precipitation is third important
                             max_ww_dur = (24,dur_dict['ww'][24])
                         duration2x = (max_ww_dur, max_wawa2_code)
-                        if __name__=='__main__' and TEST_LOG_THREAD:
+                        if DEBUG_LOG_THREAD:
                             print('     ','duration2x',duration2x,'dur_dict',dur_dict)
                     # re-initialize dur_dict
-                    dur_dict = {'ww':dict(), 'wawa':dict(), 'metar':dict()}
+                    dur_dict = {'ww':{}, 'wawa':{}, 'metar':{}}
                 # past weather code
                 try:
                     if ww is not None:
@@ -1799,11 +1962,183 @@ class PrecipThread(threading.Thread):
         record['AWEKASpresentweather'] = (self.sent_awekas,'byte','group_data')
         self.last_awekas = awekas
     
+    def parse_fields(self, reply):
+        """ split the telegram into fields and convert them
+        
+            used for Ott Parsivel, Thies LNM, and generic devices
+            
+            Args:
+                reply (str): telegram as received from the device
+                
+            Returns:
+                dict: record of value tuples
+                ww, wawa, metar, p_abs, p_rate: readings needed for
+                    the present weather processing
+                or None if the telegram could not be processed
+        """
+        ww = None
+        wawa = None
+        metar = None
+        p_abs = None
+        p_rate = None
+        # record contains value tuples here.
+        record = {}
+        is_parsivel = self.is_parsivel
+        is_thies = self.is_thies
+        # Thies LNM: initialize special values, process STX
+        if is_thies:
+            deviceState = [None]*16
+            if reply.startswith(STX): reply = reply[1:]
+        # OTT Parsivel: initialize special values
+        if is_parsivel:
+            p_count = None
+        # If the remaining telegram string does not contain a field
+        # separator, there is no field to process.
+        if self.field_separator not in reply: return
+        # Split the telegram into fields once. `pos` is the index of
+        # the next field to process. If the telegram ends with a
+        # field separator, the last element is an empty string, which
+        # does not count as a field.
+        fields = reply.split(self.field_separator)
+        nfields = len(fields) if fields[-1] else len(fields)-1
+        pos = 0
+        # Process telegram fields
+        next_obs_errors = self.next_obs_errors
+        for idx,tf in enumerate(self.telegram_list):
+            # thread stop requested (It is sufficient to check that
+            # every 16 fields.)
+            if not (idx&15) and not self.running: 
+                loginf("thread '%s': self.running==False getRecord() for telegram_list loop" % self.name)
+                return
+            # if there are not enough fields within the data telegram
+            # stop processing
+            if pos>=nfields: break
+            # get the next field
+            val = fields[pos]
+            pos += 1
+            # not enough data
+            # (for example if the connection starts inmidst of a
+            # telegram)
+            if val=='\r\n':
+                record = {}
+                break
+            # convert the field value string to the appropriate data type
+            try:
+                if tf.nr==19 and is_parsivel:
+                    # date and time
+                    # TODO
+                    val = (...,'unixepoch','group_time')
+                elif tf.nr==34 and is_parsivel:
+                    # energy
+                    # (According to the unit J/(m^2h) it is not energy
+                    # but power.)
+                    val = (float(val)/3600.0,'watt_per_meter_squared','group_rainpower')
+                elif tf.nr==61 and is_parsivel:
+                    # list of all particles
+                    # Note: If no. 60 does not precede no. 61, the count
+                    #       of values is unknown to the driver.
+                    if p_count is not None:
+                        pos -= 1
+                        val = []
+                        for jj in range(p_count):
+                            try:
+                                val.append((float(fields[pos]),float(fields[pos+1])))
+                            except (LookupError,ValueError,TypeError):
+                                val.append((None,None))
+                            pos += 2
+                            if pos>=nfields:
+                                break
+                        val = (val,None,None)
+                    else:
+                        logerr('unknown length of field 61')
+                        pos = nfields
+                # Note: Plain tuples are used instead of ValueTuple, as
+                #       creating a named tuple is much more expensive.
+                elif tf.unit=='string':
+                    # string
+                    val = (val,None,None)
+                elif tf.datatype=='INTEGER':
+                    # counter, wawa, ww
+                    val = (int(val),tf.unit,tf.group)
+                elif tf.datatype=='REAL':
+                    # float
+                    val = (float(val),tf.unit,tf.group)
+                else:
+                    print('error')
+                # correct firmware error
+                if (is_parsivel and
+                    tf.nr==4 and
+                    val[0]==62):
+                    val = (61,tf.unit,tf.group)
+                # include reading in record
+                if tf.obstype:
+                    # tf.obstype already includes prefix here.
+                    record[tf.obstype] = val
+                # remember weather codes
+                if tf.group=='group_wmo_wawa': wawa = val[0]
+                if tf.group=='group_wmo_ww': ww = val[0]
+                if is_parsivel:
+                    if tf.nr==5: metar = val[0]
+                elif is_thies:
+                    if tf.obstype.endswith('METAR'): metar = val[0]
+                # additional processing 
+                if ((tf.nr==2 and is_parsivel) or
+                    (tf.nr==17 and is_thies)):
+                    # rain
+                    if self.last_rain is not None and self.prefix:
+                        rain = val[0]-self.last_rain
+                        if val[0]<self.last_rain:
+                            rain += 300.0
+                        record[self.rain_obstype] = (rain,'mm','group_rain')
+                    self.last_rain = val[0]
+                if is_parsivel:
+                    # Ott-Hydromet Parsivel1+2
+                    if tf.nr==18:
+                        # sensor state
+                        if self.last_sensorState is None or self.last_sensorState!=val[0]:
+                            if val[0]>0:
+                                logerr("thread '%s': sensor error %s" % (self.name,val[0]))
+                            elif self.last_sensorState is None or self.last_sensorState>0:
+                                loginf("thread '%s': sensor ok" % self.name)
+                        self.last_sensorState = val[0]
+                    elif tf.nr==9:
+                        # data sending interval
+                        self.device_interval = val[0]
+                    elif tf.nr==1:
+                        # rain intensity
+                        p_rate = val[0]
+                    elif tf.nr==2:
+                        # rain accumulated
+                        p_abs = val[0]
+                    elif tf.nr==60:
+                        p_count = val[0]
+                elif is_thies:
+                    # Thies LNM
+                    if 22<=tf.nr<38: deviceState[tf.nr-22] = val[0]
+                    if tf.nr==14: p_rate = val[0]
+                    if tf.nr==17: p_abs = val[0]
+            except (LookupError,ValueError,TypeError,ArithmeticError) as e:
+                # log the same error once in 300 seconds only
+                if next_obs_errors.get(tf.obstype,0)<time.time():
+                    logerr("thread '%s': %s %s %s traceback %s" % (self.name,tf.obstype,e.__class__.__name__,e,gettraceback(e)))
+                    next_obs_errors[tf.obstype] = time.time()+300
+        # Thies LNM: list of state values (no. 22 to 37)
+        if is_thies and self.prefix:
+            record[self.prefix+'DeviceError'] = (deviceState[0:7],'byte','group_data')
+            record[self.prefix+'DeviceWarning'] = (deviceState[7:15],'byte','group_data')
+        return record, ww, wawa, metar, p_abs, p_rate
+
+    def parse_unknown(self, reply):
+        """ no telegram parser available for the configured model """
+        logerr("thread '%s': unknown model '%s'" % (self.name,self.model))
+        self.shutDown()
+        return None
+    
     def getRecord(self, ot):
         """ fetch data from the device and decode it
         """
     
-        if __name__ == '__main__' and TEST_LOG_THREAD:
+        if DEBUG_LOG_THREAD:
             print()
             print('-----',self.name,'-----',ot,'-----',self.connection_type,'-----')
 
@@ -1830,37 +2165,58 @@ class PrecipThread(threading.Thread):
                 # which means to try it again.
                 self.evt.wait(self.query_interval)
                 return
-            reply = b''
+            if self.connection_type=='udp':
+                # Each datagram contains one telegram.
+                self.rx_buffer.clear()
+            # TCP: Data that arrived after the end of the previous
+            # telegram remain in self.rx_buffer. Only the newly arrived
+            # data need to be searched for the telegram end.
+            nl = -1
+            scan_from = 0
             while self.running:
+                if self.connection_type=='tcp':
+                    nl = self.rx_buffer.find(b'\n',scan_from)
+                    if nl>=0: break
+                    scan_from = len(self.rx_buffer)
                 # pause thread and wait for data from the device
-                rlist, wlist, xlist = select.select([self.socket],[],[],self.query_interval)
+                events = self.selector.select(self.query_interval)
                 # If shutdown is requested, log and return
                 if not self.running:
-                    loginf("thread '%s': self.running==False getRecord() select() r %s w %s x %s" % (self.name,rlist,wlist,xlist))
+                    loginf("thread '%s': self.running==False getRecord() select() events %s" % (self.name,events))
                     return
                 # No data received until timeout --> return
-                if not rlist: 
+                if not events: 
                     return
                 # get available data from the device
                 try:
                     if self.connection_type=='udp':
                         # UDP connection
-                        reply, source_addr = self.socket.recvfrom(8192)
+                        n, source_addr = self.socket.recvfrom_into(self.rx_chunk)
                         if source_addr!=self.host: 
                             logerr("thread '%s': received data from %s but %s expected" %(self.name,source_addr,self.host))
                             return
+                        self.rx_buffer += self.rx_view[:n]
                         break
                     else:
                         # TCP connection
-                        x = self.socket.recv(8192)
-                        reply += x
-                        if b'\n' in reply: break
+                        n = self.socket.recv_into(self.rx_chunk)
+                        self.rx_buffer += self.rx_view[:n]
                 except OSError as e:
                     logerr("thread '%s': error receiving data %s %s" % (self.name,e.__class__.__name__,e))
                     self.socket_close()
                     return
+            if self.connection_type=='tcp':
+                # no complete telegram received
+                if nl<0: return
+                reply = bytes(self.rx_buffer[:nl+1])
+                del self.rx_buffer[:nl+1]
+            else:
+                reply = bytes(self.rx_buffer)
             # The very first telegram may be incomplete, so do not process it.
             if ot=='once': return
+            # Incomplete telegram. Do not decode it.
+            if (self.record_separator_bytes not in reply or
+                self.field_separator_bytes not in reply): return
             # Convert bytes to ASCII string
             reply = reply.decode('ascii',errors='ignore')
         elif self.connection_type in ('restful','http','https'):
@@ -1870,15 +2226,29 @@ class PrecipThread(threading.Thread):
         elif self.connection_type=='usb':
             # The device is connected by USB
             if not self.file: 
-                self.file = open(self.port,'rt')
-                os.set_blocking(file.fileno(), False)
+                self.file = open(self.port,'rb',buffering=0)
+                os.set_blocking(self.file.fileno(), False)
+                self.selector.register(self.file,selectors.EVENT_READ)
             if not self.file: return
-            reply = ''
-            while ('\n' not in reply) and self.running:
-                rlist, wlist, xlist = select.select([self.file],[],[],5)
-                if not rlist or not self.running: return
-                reply += file.read()
+            # Data that arrived after the end of the previous record 
+            # remain in self.rx_buffer. Only the newly arrived data
+            # need to be searched for the record end.
+            scan_from = 0
+            while True:
+                nl = self.rx_buffer.find(b'\n',scan_from)
+                if nl>=0: break
+                scan_from = len(self.rx_buffer)
+                events = self.selector.select(5)
+                if not events or not self.running: return
+                self.rx_buffer += self.file.read() or b''
+            reply = bytes(self.rx_buffer[:nl+1])
+            del self.rx_buffer[:nl+1]
             if ot=='once': return
+            # Incomplete telegram. Do not decode it.
+            if (self.record_separator_bytes not in reply or
+                self.field_separator_bytes not in reply): return
+            # Convert bytes to ASCII string
+            reply = reply.decode('ascii',errors='ignore')
         else:
             # simulator mode
             if ot=='once':
@@ -1886,9 +2256,9 @@ class PrecipThread(threading.Thread):
                 reply = "Ott Parsivel2\r\n"
                 self.device_interval = self.query_interval
             else:
-                temp = int(round(25+2*math.sin((time.time()%30)/30*math.pi),0))
+                temp = SIMULATOR_TEMP[int(time.time())%30]
                 since = int(time.time()-self.start_ts)
-                if __name__ == '__main__' and TEST_LOG_THREAD:
+                if DEBUG_LOG_THREAD:
                     print('///////////////////////',since,'///////////////////////')
                 if SIMULATE_ERRONEOUS_READING:
                     # erroneous reading
@@ -1915,7 +2285,7 @@ class PrecipThread(threading.Thread):
                         ww = 53
                         rainrate = 0.1
                         self.rain_simulator += 0.25
-                reply = "200248;%7.3f;%7.2f;%02d;-9.999;9999;000.00;%03d;15759;00000;0;\r\n" % (rainrate,self.rain_simulator,ww,temp)
+                reply = f"200248;{rainrate:7.3f};{self.rain_simulator:7.2f};{ww:02d};-9.999;9999;000.00;{temp:03d};15759;00000;0;\r\n"
         
         if not self.running: 
             loginf("thread '%s': self.running==False getRecord() after reading data" % self.name)
@@ -1923,167 +2293,14 @@ class PrecipThread(threading.Thread):
         
         # process data
         
-        if ((self.field_separator not in reply) or 
-            (self.record_separator not in reply)):
+        # Incomplete telegram. (The field separator is checked below.)
+        if self.record_separator not in reply:
             return
         ts = int(time.time())
-        ww = None
-        wawa = None
-        metar = None
-        p_abs = None
-        p_rate = None
         # record contains value tuples here.
-        record = dict()
-        if (self.model.startswith('ott-parsivel') or 
-            self.model in ('thies-lnm','generic')):
-            # Thies LNM: initialize special values, process STX
-            if self.model=='thies-lnm':
-                deviceState = [None]*16
-                if reply[0]==chr(2): reply = reply[1:]
-            # OTT Parsivel: initialize special values
-            if self.model.startswith('ott-parsivel'):
-                p_count = None
-            # If the remaining telegram string does not contain a field
-            # separator any more, there is no field to process any more.
-            if self.field_separator not in reply: reply = ''
-            # Process telegram fields
-            for ii in self.telegram_list:
-                # thread stop requested
-                if not self.running: 
-                    loginf("thread '%s': self.running==False getRecord() for telegram_list loop" % self.name)
-                    return
-                # if there are not enough fields within the data telegram
-                # stop processing
-                if not reply: break
-                # split the first remaining field 
-                x = reply.split(self.field_separator,1)
-                try:
-                    val = x[0]
-                except LookupError:
-                    val = ''
-                try:
-                    reply = x[1]
-                except LookupError:
-                    reply = ''
-                # not enough data
-                # (for example if the connection starts inmidst of a
-                # telegram)
-                if val=='\r\n':
-                    record = dict()
-                    break
-                # convert the field value string to the appropriate data type
-                try:
-                    if ii[0]==19 and self.model.startswith('ott-parsivel'):
-                        # date and time
-                        # TODO
-                        val = (...,'unixepoch','group_time')
-                    elif ii[0]==34 and self.model.startswith('ott-parsivel'):
-                        # energy
-                        # (According to the unit J/(m^2h) it is not energy
-                        # but power.)
-                        val = (float(val)/3600.0,'watt_per_meter_squared','group_rainpower')
-                    elif ii[0]==61 and self.model.startswith('ott-parsivel'):
-                        # list of all particles
-                        # Note: If no. 60 does not precede no. 61, the count
-                        #       of values is unknown to the driver.
-                        if p_count is not None:
-                            reply = val+self.field_separator+reply
-                            val = []
-                            for jj in range(p_count):
-                                x = reply.split(self.field_separator,2)
-                                try:
-                                    val.append((float(x[0]),float(x[1])))
-                                except (LookupError,ValueError,TypeError):
-                                    val.append((None,None))
-                                try:
-                                    reply = x[2]
-                                except LookupError:
-                                    reply = ''
-                                if not reply:
-                                    break
-                            val = (val,None,None)
-                        else:
-                            logerr('unknown length of field 61')
-                            reply = ''
-                    elif ii[5]=='string':
-                        # string
-                        val = weewx.units.ValueTuple(str(val),None,None)
-                    elif ii[7]=='INTEGER':
-                        # counter, wawa, ww
-                        val = weewx.units.ValueTuple(int(val),ii[5],ii[6])
-                    elif ii[7]=='REAL':
-                        # float
-                        val = weewx.units.ValueTuple(float(val),ii[5],ii[6])
-                    else:
-                        print('error')
-                    # correct firmware error
-                    if (self.model.startswith('ott-parsivel') and
-                        ii[0]==4 and
-                        val[0]==62):
-                        val = weewx.units.ValueTuple(61,ii[5],ii[6])
-                    # include reading in record
-                    if ii[4]:
-                        # ii[4] already includes prefix here.
-                        record[ii[4]] = val
-                    # remember weather codes
-                    if ii[6]=='group_wmo_wawa': wawa = val[0]
-                    if ii[6]=='group_wmo_ww': ww = val[0]
-                    if self.model.startswith('ott-parsivel'):
-                        if ii[0]==5: metar = val[0]
-                    elif self.model=='thies-lnm':
-                        if ii[4].endswith('METAR'): metar = val[0]
-                    # additional processing 
-                    if ((ii[0]==2 and self.model.startswith('ott-parsivel')) or
-                        (ii[0]==17 and self.model=='thies-lnm')):
-                        # rain
-                        if self.last_rain is not None and self.prefix:
-                            rain = val[0]-self.last_rain
-                            if val[0]<self.last_rain:
-                                rain += 300.0
-                            record[self.prefix+'Rain'] = (rain,'mm','group_rain')
-                        self.last_rain = val[0]
-                    if self.model.startswith('ott-parsivel'):
-                        # Ott-Hydromet Parsivel1+2
-                        if ii[0]==18:
-                            # sensor state
-                            if self.last_sensorState is None or self.last_sensorState!=val[0]:
-                                if val[0]>0:
-                                    logerr("thread '%s': sensor error %s" % (self.name,val[0]))
-                                elif self.last_sensorState is None or self.last_sensorState>0:
-                                    loginf("thread '%s': sensor ok" % self.name)
-                            self.last_sensorState = val[0]
-                        elif ii[0]==9:
-                            # data sending interval
-                            self.device_interval = val[0]
-                        elif ii[0]==1:
-                            # rain intensity
-                            p_rate = val[0]
-                        elif ii[0]==2:
-                            # rain accumulated
-                            p_abs = val[0]
-                        elif ii[0]==60:
-                            p_count = val[0]
-                    elif self.model=='thies-lnm':
-                        # Thies LNM
-                        if 22<=ii[0]<38: deviceState[ii[0]-22] = val[0]
-                        if ii[0]==14: p_rate = val[0]
-                        if ii[0]==17: p_abs = val[0]
-                except (LookupError,ValueError,TypeError,ArithmeticError) as e:
-                    # log the same error once in 300 seconds only
-                    if ii[4] not in self.next_obs_errors:
-                        self.next_obs_errors[ii[4]] = 0
-                    if self.next_obs_errors[ii[4]]<time.time():
-                        logerr("thread '%s': %s %s %s traceback %s" % (self.name,ii[4],e.__class__.__name__,e,gettraceback(e)))
-                        self.next_obs_errors[ii[4]] = time.time()+300
-            # Thies LNM: list of state values (no. 22 to 37)
-            if self.model=='thies-lnm' and self.prefix:
-                record[self.prefix+'DeviceError'] = (deviceState[0:7],'byte','group_data')
-                record[self.prefix+'DeviceWarning'] = (deviceState[7:15],'byte','group_data')
-        #elif self.model=='...'
-        #    ...
-        else:
-            logerr("thread '%s': unknown model '%s'" % (self.name,self.model))
-            self.shutDown()
+        x = self.parse_reply(reply)
+        if x is None: return
+        record, ww, wawa, metar, p_abs, p_rate = x
 
         # If WeeWX requested to shutdown stop further processing and
         # return immediately.
@@ -2099,7 +2316,9 @@ class PrecipThread(threading.Thread):
                 if record:
                     if self.prefix:
                         # history of present weather codes of the last hour
-                        record[self.prefix+'History'] = (self.presentweather_list,'byte','group_data')
+                        # (A snapshot, as this thread goes on changing
+                        # the list while WeeWX processes the record.)
+                        record[self.history_obstype] = (tuple(tuple(ii) for ii in self.presentweather_list),'byte','group_data')
                     if self.set_weathercodes:
                         # start timestamp of the current precipitation
                         # independent of kind and intensity
@@ -2118,7 +2337,7 @@ class PrecipThread(threading.Thread):
         # `...RainDur`
         if record and self.prefix:
             # precipitation duration
-            record[self.prefix+'RainDur'] = (
+            record[self.raindur_obstype] = (
                 self.device_interval if is_ww_wawa_precipitation(ww,wawa) else 0.0,
                 'second',
                 'group_deltatime')
@@ -2137,6 +2356,10 @@ class PrecipThread(threading.Thread):
                 if self.presentweather_lock.acquire():
                     try:
                         ww, wawa, since, elapsed, wa_list = self.presentweather(ts)
+                        # presentweather() updates intsum and dursum of
+                        # the list elements, so renew the snapshot.
+                        if self.history_obstype in record:
+                            record[self.history_obstype] = (tuple(tuple(ii) for ii in self.presentweather_list),'byte','group_data')
                     finally:
                         self.presentweather_lock.release()
                     if ww is not None: 
@@ -2161,8 +2384,8 @@ class PrecipThread(threading.Thread):
         # `visibility`
         if record and self.set_visibility and self.prefix:
             try:
-                if (self.prefix+'MOR') in record: 
-                    record['visibility'] = record[self.prefix+'MOR']
+                if self.mor_obstype in record: 
+                    record['visibility'] = record[self.mor_obstype]
             except (LookupError,ValueError,TypeError,ArithmeticError) as e:
                 pass
 
@@ -2176,24 +2399,24 @@ class PrecipThread(threading.Thread):
             # key in the `[PrecipMeter]` section and have it point to
             # the device subsection you want to get the readings from.
             try:
-                if (self.prefix+'Rain') in record:
-                    record['rain'] = record[self.prefix+'Rain']
-                if (self.prefix+'RainRate') in record:
-                    record['rainRate'] = record[self.prefix+'RainRate']
+                if self.rain_obstype in record:
+                    record['rain'] = record[self.rain_obstype]
+                if self.rainrate_obstype in record:
+                    record['rainRate'] = record[self.rainrate_obstype]
             except (LookupError,ValueError,TypeError,ArithmeticError):
                 pass
         
         # `rainDur`
         if record and self.set_rainDur and self.prefix:
             try:
-                if (self.prefix+'RainDur') in record:
-                    record['rainDur'] = record[self.prefix+'RainDur']
+                if self.raindur_obstype in record:
+                    record['rainDur'] = record[self.raindur_obstype]
             except (LookupError,ValueError,TypeError,ArithmeticError):
                 pass
         
         # send record to queue for processing in the main thread
         
-        if __name__ == '__main__' and TEST_LOG_THREAD:
+        if DEBUG_LOG_THREAD:
             print(record)
         if ot=='loop':
             self.put_data(ts,record)
@@ -2209,17 +2432,9 @@ class PrecipThread(threading.Thread):
             Returns:
                 nothing
         """
-        if x:
-            if self.data_queue:
-                try:
-                    self.data_queue.put((self.name,x,ts),
-                                block=False)
-                except queue.Full:
-                    # If the queue is full (which should not happen),
-                    # ignore the packet
-                    pass
-                except (KeyError,ValueError,LookupError,ArithmeticError) as e:
-                    logerr("thread '%s': %s %s traceback %s" % (self.name,e.__class__.__name__,e,gettraceback(e)))
+        if x and self.data_queue:
+            # The queue is unbounded, so put() never blocks or fails.
+            self.data_queue.put((self.name,x,ts))
                     
     def get_archive_record(self, timespan):
         """ get an archive record for timespan 
@@ -2235,7 +2450,7 @@ class PrecipThread(threading.Thread):
             Returns:
                 dict: dict of readings 
         """
-        record = dict()
+        record = {}
         ww_list = []
         wawa_list = []
         ww = None
@@ -2374,6 +2589,12 @@ class PrecipThread(threading.Thread):
     
     def run(self):
         loginf("thread '%s' starting" % self.name)
+        if self.affinity:
+            # bind this thread to the configured CPUs
+            try:
+                os.sched_setaffinity(0,self.affinity)
+            except (AttributeError,OSError,TypeError,ValueError) as e:
+                logerr("thread '%s': could not set CPU affinity %s: %s %s",self.name,self.affinity,e.__class__.__name__,e)
         self.db_open()
         try:
             self.getRecord('once')
@@ -2392,9 +2613,13 @@ class PrecipThread(threading.Thread):
                     logerr("thread '%s': *** %s" % (self.name,jj.replace('\n',' ').strip()))
         finally:
             # remember the present weather codes of the last hour
+            # (The file is written under a temporary name and renamed
+            # afterwards, so that an interrupted write does not destroy
+            # the previous contents.)
             try:
-                with open(self.db_fn+'.json','wt') as file:
+                with open(self.db_fn+'.json.tmp','wt') as file:
                     json.dump(self.presentweather_list,file)
+                os.replace(self.db_fn+'.json.tmp',self.db_fn+'.json')
             except Exception as e:
                 logerr("thread '%s': %s %s" % (self.name,e.__class__.__name__,e))
             # close socket and file descriptors
@@ -2408,6 +2633,7 @@ class PrecipThread(threading.Thread):
                     self.file.close()
                 except Exception as e:
                     logerr("thread '%s': error closing file %s %s" % (self.name,e.__class__.__name__,e))
+            self.selector.close()
             # close database connection
             try:
                 self.db_close()
@@ -2463,7 +2689,7 @@ class Freezing(list):
             for idx, val in enumerate(val_vt[0]):
                 start = start_vt[0][idx]
                 if val is not None: val = bool(int(val))
-                logdbg("frost indicator list [%s] = (%s,%s)" % (idx,start,val))
+                logdbg("frost indicator list [%s] = (%s,%s)", idx,start,val)
                 self.append((start,val))
             if log_success:
                 loginf("%s elements backfilled into frost indicator list" % len(self))
@@ -2489,9 +2715,11 @@ class PrecipData(StdService):
             self.log_success = True
             self.log_failure = True
         self.threads = dict()
+        # conversion functions by (thread_name,usUnits) and observation type
+        self.conversions = dict()
         self.dbm = None
-        self.archive_interval = int(config_dict.get('StdArchive',configobj.ConfigObj()).get('archive_interval',300))
-        sqlite_root = config_dict.get('DatabaseTypes',configobj.ConfigObj()).get('SQLite',configobj.ConfigObj()).get('SQLITE_ROOT','.')
+        self.archive_interval = int(config_dict.get('StdArchive',EMPTY_CONF).get('archive_interval',300))
+        sqlite_root = config_dict.get('DatabaseTypes',EMPTY_CONF).get('SQLite',EMPTY_CONF).get('SQLITE_ROOT','.')
         weewx.units.obs_group_dict.setdefault('ww','group_wmo_ww')
         weewx.units.obs_group_dict.setdefault('wawa','group_wmo_wawa')
         weewx.units.obs_group_dict.setdefault('presentweatherWw','group_wmo_ww')
@@ -2524,6 +2752,8 @@ class PrecipData(StdService):
         weewx.accum.accum_dict.setdefault('frostIndicator',ACCUM_MAX)
         weewx.accum.accum_dict.setdefault('AWEKASpresentweather',ACCUM_LAST)
         if 'PrecipMeter' in config_dict:
+            # used by _create_thread()
+            self.unit_to_group = unit_to_group()
             ct = 0
             for name in config_dict['PrecipMeter'].sections:
                 dev_dict = weeutil.config.accumulateLeaves(config_dict['PrecipMeter'][name])
@@ -2610,44 +2840,30 @@ class PrecipData(StdService):
                 thread_dict['telegram'] = "%13;%01;%02;%03;%07;%08;%34;%12;%10;%11;%18;/r/n"
             # parse config string
             t = []
-            ct = None
-            for ii in thread_dict['telegram']:
-                if ct is not None:
-                    if ii.isdigit():
-                        ct.append(ii)
-                    else:
-                        nr = int(''.join(ct))
-                        for jj in PARSIVEL:
-                            if jj[0]==nr:
-                                obstype = jj[4]
-                                # TODO prefix
-                                if 'prefix' in thread_dict and jj[4]:
-                                    obstype = thread_dict['prefix']+jj[4][0].upper()+jj[4][1:]
-                                else:
-                                    obstype = jj[4]
-                                if jj[6] in ('group_count',
-                                             'group_wmo_ww',
-                                             'group_wmo_wawa',
-                                             'group_boolean'):
-                                    obsdatatype = 'INTEGER'
-                                elif jj[5]=='string':
-                                    obsdatatype = 'VARCHAR(%d)' % jj[2]
-                                else:
-                                    obsdatatype = 'REAL'
-                                if nr in (90,91,93):
-                                    width = 4 if nr==93 else 2
-                                    for subfield in range((jj[2]+1)//len(jj[3])):
-                                        if obstype:
-                                            subobstype = '%s%0*d' % (obstype,width,subfield)
-                                        else:
-                                            subobstype = None
-                                        t.append((jj[0],jj[1],len(jj[3]),jj[3],subobstype,)+jj[5:]+(obsdatatype,))
-                                else:
-                                    t.append(jj[0:4]+(obstype,)+jj[5:]+(obsdatatype,))
-                                break
-                        ct = None
-                elif ii=='%':
-                    ct = []
+            for nr in re.findall(r'%(\d+)',thread_dict['telegram']):
+                jj = PARSIVEL_BY_NR.get(int(nr))
+                if not jj: continue
+                # TODO prefix
+                if 'prefix' in thread_dict and jj[4]:
+                    obstype = thread_dict['prefix']+jj[4][0].upper()+jj[4][1:]
+                else:
+                    obstype = jj[4]
+                if jj[6] in INTEGER_GROUPS:
+                    obsdatatype = 'INTEGER'
+                elif jj[5]=='string':
+                    obsdatatype = 'VARCHAR(%d)' % jj[2]
+                else:
+                    obsdatatype = 'REAL'
+                if jj[0] in (90,91,93):
+                    width = 4 if jj[0]==93 else 2
+                    for subfield in range((jj[2]+1)//len(jj[3])):
+                        if obstype:
+                            subobstype = '%s%0*d' % (obstype,width,subfield)
+                        else:
+                            subobstype = None
+                        t.append((jj[0],jj[1],len(jj[3]),jj[3],subobstype,)+jj[5:]+(obsdatatype,))
+                else:
+                    t.append(jj[0:4]+(obstype,)+jj[5:]+(obsdatatype,))
             thread_dict['loop'] = t
         elif model=='thies' and 'loop' not in thread_dict:
             # The prefix is 'thies' if the user did not set a prefix.
@@ -2657,7 +2873,7 @@ class PrecipData(StdService):
                 thread_dict['telegram'] = 4
             telegram = weeutil.weeutil.to_int(thread_dict['telegram'])
             t = []
-            for ii in THIES[telegram]:
+            for ii in THIES[telegram]():
                 if ii[4]:
                     if thread_dict['prefix']:
                         obstype = thread_dict['prefix']+ii[4][0].upper()+ii[4][1:]
@@ -2665,10 +2881,7 @@ class PrecipData(StdService):
                         obstype = ii[4]
                 else:
                     obstype = None
-                if ii[6] in ('group_count',
-                             'group_wmo_ww',
-                             'group_wmo_wawa',
-                             'group_boolean'):
+                if ii[6] in INTEGER_GROUPS:
                     obsdatatype = 'INTEGER'
                 elif ii[5]=='string':
                     obsdatatype = 'VARCHAR(%d)' % ii[2]
@@ -2688,17 +2901,25 @@ class PrecipData(StdService):
                 desc = thread_dict['loop'][ii].get('description','')
                 if obsdatatype in ('REAL','INTEGER'):
                     obssize = 8
-                elif obsdatatype[0:7]=='VARCHAR':
-                    obssize = int(obsdatatype[8:])
+                elif obsdatatype.startswith('VARCHAR('):
+                    # VARCHAR(size)
+                    obssize = int(obsdatatype[8:].rstrip(') '))
                 else:
                     obssize = 0
                 t.append((ii,desc,obssize,'X'*obssize,obstype,obsunit,obsgroup,obsdatatype))
             thread_dict['loop'] = t
+        # intern observation type, unit, and unit group names, as they
+        # are compared again and again for every reading
+        thread_dict['loop'] = [
+            TelegramField(*(ii[0:4]+tuple(sys.intern(jj) if isinstance(jj,str) else jj for jj in ii[4:7])+ii[7:]))
+            for ii in thread_dict['loop']]
         if __name__=='__main__':
             print(json.dumps(thread_dict['loop'],indent=4,ensure_ascii=False))
         # create thread
         self.threads[thread_name] = dict()
-        self.threads[thread_name]['queue'] = queue.Queue()
+        # The queue is unbounded, so SimpleQueue (Python 3.7 and later)
+        # does the same with less locking overhead.
+        self.threads[thread_name]['queue'] = getattr(queue,'SimpleQueue',queue.Queue)()
         self.threads[thread_name]['thread'] = PrecipThread(thread_name,thread_dict,self.threads[thread_name]['queue'],query_interval)
         self.threads[thread_name]['reply_count'] = 0
         self.threads[thread_name]['accum'] = dict()
@@ -2733,23 +2954,14 @@ class PrecipData(StdService):
             obstype,obsunit,obsgroup,obsdatatype = ii[4:]
             if not obsgroup and obsunit:
                 # if no unit group is given, try to find out
-                for jj in weewx.units.MetricUnits:
-                    if weewx.units.MetricUnits[jj]==obsunit:
-                        obsgroup = jj
-                        break
-                if not obsgroup:
-                    for jj in weewx.units.USUnits:
-                        if weewx.units.USUnits[jj]==obsunit:
-                            obsgroup = jj
-                            break
+                obsgroup = self.unit_to_group.get(obsunit)
             if obstype:
                 if obsgroup:
                     weewx.units.obs_group_dict.setdefault(obstype,obsgroup)
-                    if (obsgroup in ('group_deltatime','group_elapsed',
-                                     'group_time','group_count') and
+                    if (obsgroup in ACCUM_LAST_GROUPS and
                         obstype not in weewx.accum.accum_dict):
                         _accum[obstype] = ACCUM_LAST
-                    elif obsgroup in ('group_wmo_ww','group_wmo_wawa'):
+                    elif obsgroup in ACCUM_NOOP_GROUPS:
                         _accum[obstype] = ACCUM_NOOP
                 if (obstype.endswith('RainAccu') and
                     obstype not in weewx.accum.accum_dict):
@@ -2768,20 +2980,20 @@ class PrecipData(StdService):
     def shutDown(self):
         """ Shutdown threads. """
         # request shutdown
-        for ii in self.threads:
+        for thread in self.threads.values():
             try:
-                self.threads[ii]['thread'].shutDown()
+                thread['thread'].shutDown()
             except:
                 pass
         # wait at max 10 seconds for shutdown to complete
         timeout = time.time()+10
-        for ii in self.threads:
+        for thread in self.threads.values():
             try:
                 w = timeout-time.time()
                 if w<=0: break
-                self.threads[ii]['thread'].join(w)
-                if self.threads[ii]['thread'].is_alive():
-                    logerr("unable to shutdown thread '%s'" % self.threads[ii]['thread'].name)
+                thread['thread'].join(w)
+                if thread['thread'].is_alive():
+                    logerr("unable to shutdown thread '%s'" % thread['thread'].name)
             except:
                 pass
         # report threads that are still alive
@@ -2800,16 +3012,19 @@ class PrecipData(StdService):
     
     def _process_data(self, thread_name):
         """ Get and process data from the threads. """
-        AVG_GROUPS = ('group_temperature','group_db','group_distance','group_volt')
-        MAX_GROUPS = ('group_wmo_ww','group_wmo_wawa')
-        SUM_GROUPS = ('group_deltatime',)
+        thread_dict = self.threads[thread_name]
+        thread_accum = thread_dict['accum']
+        data_queue = thread_dict['queue']
+        prefix = thread_dict.get('prefix')
+        rain_key = prefix+'Rain' if prefix else None
+        special_accumulator_add = self.special_accumulator_add
         # get collected data
-        data = dict()
+        data = {}
         ct = 0
         while True:
             try:
                 # get the next packet
-                reply = self.threads[thread_name]['queue'].get(block=False)
+                reply = data_queue.get_nowait()
             except queue.Empty:
                 # no more packets available so far
                 break
@@ -2827,28 +3042,32 @@ class PrecipData(StdService):
                 # accumulate readings that arrived since the last LOOP
                 # packet
                 for key,val in reply[1].items():
-                    if key in data:
+                    prev = data.get(key)
+                    if prev is not None:
                         # further occurances of the observation type
-                        if key in ('presentweatherWw','presentweatherWawa','presentweatherStart','presentweatherTime','precipitationStart'):
+                        if key in LAST_OBSTYPES:
                             data[key] = val
-                        elif ((self.threads[thread_name].get('prefix') and
-                            key==(self.threads[thread_name]['prefix']+'Rain')) or
-                            val[2] in SUM_GROUPS):
+                        elif key==rain_key or val[2] in SUM_GROUPS:
                             # calculate rain amount during interval
-                            try:
-                                data[key] = (data[key][0]+val[0],val[1],val[2])
-                            except ArithemticError:
-                                pass
+                            # (Missing readings do not count.)
+                            if val[0] is not None:
+                                if prev[0] is None:
+                                    data[key] = val
+                                else:
+                                    data[key] = (prev[0]+val[0],val[1],val[2])
                         elif val[2] in AVG_GROUPS:
                             # average
+                            # (sum and count are updated in place)
                             try:
-                                data[key] = ((data[key][0][0]+val[0],data[key][0][1]+1),val[1],val[2])
+                                acc = prev[0]
+                                acc[0] += val[0]
+                                acc[1] += 1
                             except ArithmeticError:
                                 data[key] = val
                         elif val[2] in MAX_GROUPS:
                             # maximum
                             try:
-                                if data[key][0]<val[0]:
+                                if prev[0]<val[0]:
                                     data[key] = val
                             except ArithmeticError:
                                 pass
@@ -2857,11 +3076,12 @@ class PrecipData(StdService):
                     else:
                         # first occurance of this observation type
                         if val[2] in AVG_GROUPS:
-                            data[key] = ((val[0],1),val[1],val[2])
+                            # [sum, count] to calculate the average
+                            data[key] = ([val[0],1],val[1],val[2])
                         else:
                             data[key] = val
                     # special accumulators
-                    self.special_accumulator_add(thread_name,key,val)
+                    special_accumulator_add(thread_accum,key,val)
                 ct += 1
         if data:
             for key in data:
@@ -2873,14 +3093,18 @@ class PrecipData(StdService):
             return data
         return None
     
-    def special_accumulator_add(self, thread_name, key, val):
-        """ Add value to special accumulator. """
+    def special_accumulator_add(self, thread_accum, key, val):
+        """ Add value to special accumulator. 
+        
+            thread_accum - self.threads[thread_name]['accum']
+            key          - observation type
+            val          - value tuple
+        """
         # ignore None values
         if val[0] is None: return
         # history of the present weather
         if val[2]=='group_data' and key.endswith('History'):
-            obs = (key,val[1],val[2])
-            self.threads[thread_name]['accum'][obs] = val[0]
+            thread_accum[(key,val[1],val[2])] = val[0]
         
     def new_special_accumulator(self, timestamp):
         """ Initialize timespan for special accumulators. """
@@ -2905,12 +3129,8 @@ class PrecipData(StdService):
         # For 'group_data' always the last reading is returned.
         if obsgroup=='group_data':
             return accum
-        # The first element of accum is always out of the previous archive
-        # interval. If it is the only element, no value is received during 
-        # the actual archive interval. So return None.
-        if len(accum)==1:
-            return None
-        # no accumulator for this observation type
+        # No accumulator for this observation type. `ww` and `wawa`
+        # are accumulated by the thread in get_archive_record().
         return None
     
     def special_accumulators(self, thread_name, thread_accum, timestamp):
@@ -3027,14 +3247,7 @@ class PrecipData(StdService):
                     val_val = 17
             # freezing rain or drizzle
             if self.is_freezing.state_at_timestamp(ts):
-                if val_val in (50,51):
-                    val_val = 56
-                elif val_val in (52,53,54,55):
-                    val_val = 57
-                elif val_val in (60,61,58):
-                    val_val = 66
-                elif val_val in (62,63,64,65,59):
-                    val_val = 67
+                val_val = WW_FREEZING_REVERSED.get(val_val,val_val)
             if val_val in (20,21):
                 precip_time_end = ts-record.get('presentweatherTime',0)
                 if self.is_freezing.max_of_timespan((precip_time_end-3600,precip_time_end)):
@@ -3057,12 +3270,7 @@ class PrecipData(StdService):
                     val_val = 90
             # freezing rain or drizzle
             if self.is_freezing.state_at_timestamp(ts):
-                if val_val in (51,52,53,61,62,63):
-                    val_val += 3
-                elif val_val==57:
-                    val_val = 64
-                elif val_val==58:
-                    val_val = 66
+                val_val = WAWA_FREEZING_REVERSED.get(val_val,val_val)
             if val_val in (21,22,23):
                 precip_time_end = ts-record.get('presentweatherTime',0)
                 if self.is_freezing.max_of_timespan((precip_time_end-3600,precip_time_end)):
@@ -3079,11 +3287,11 @@ class PrecipData(StdService):
     def new_loop_packet(self, event):
         """ Process LOOP event. """
         timestamp = event.packet.get('dateTime',time.time())
-        for thread_name in self.threads:
+        for thread_name, thread in self.threads.items():
             # if the LOOP packet belongs to a new archive interval, calculate
             # the accumulated values
             if self.accum_end_ts and timestamp>self.accum_end_ts:
-                self.special_accumulators(thread_name,self.threads[thread_name]['accum'],timestamp)
+                self.special_accumulators(thread_name,thread['accum'],timestamp)
             # get readings that newly arrived since the last LOOP event 
             reply = self._process_data(thread_name)
             # if new data is available process them and update the LOOP packet
@@ -3101,7 +3309,7 @@ class PrecipData(StdService):
                         awekas1 = AWEKAS[self.current_awekas][2] if self.current_awekas is not None else -1
                         awekas2 = AWEKAS[new_awekas][2] if new_awekas is not None else -1
                         if new_awekas:
-                            logdbg('AWEKAS vgl %s %s %s %s' % (self.current_awekas,new_awekas,awekas1,awekas2))
+                            logdbg('AWEKAS vgl %s %s %s %s', self.current_awekas,new_awekas,awekas1,awekas2)
                         if awekas2>awekas1:
                             self.current_awekas = new_awekas
                 except (LookupError,ValueError,TypeError,ArithmeticError) as e:
@@ -3110,7 +3318,7 @@ class PrecipData(StdService):
                 data = self._to_weewx(thread_name,reply,event.packet['usUnits'])
                 # log 
                 if self.debug>=3: 
-                    logdbg("PACKET %s:%s" % (thread_name,data))
+                    logdbg("PACKET %s:%s", thread_name,data)
                 # 'dateTime' and 'interval' must not be in data
                 if 'dateTime' in data: del data['dateTime']
                 if 'interval' in data: del data['interval']
@@ -3118,7 +3326,7 @@ class PrecipData(StdService):
                 # update loop packet with device data
                 event.packet.update(data)
                 # count records received from the device
-                self.threads[thread_name]['reply_count'] += reply.get('count',(0,None,None))[0]
+                thread['reply_count'] += reply.get('count',(0,None,None))[0]
         # if the LOOP packet belongs to a new archive interval, initialize
         # the new archive timespan
         if not self.accum_end_ts or timestamp>self.accum_end_ts:
@@ -3183,22 +3391,23 @@ class PrecipData(StdService):
         ts = event.record.get('dateTime',time.time())
         interval = event.record.get('interval',self.archive_interval/60)*60
         timespan = (ts-interval,ts)
-        for thread_name in self.threads:
-            # log error if we did not receive any data from the device
-            if self.log_failure and not self.threads[thread_name]['reply_count']:
-                logerr("no data received from %s during archive interval" % thread_name)
-            # log success to see that we are still receiving data
-            if self.log_success and self.threads[thread_name]['reply_count']:
-                loginf("%s records received from %s during archive interval" % (self.threads[thread_name]['reply_count'],thread_name))
-            # reset counter
-            self.threads[thread_name]['reply_count'] = 0
+        received = []
+        missing = []
+        for thread_name, thread in self.threads.items():
+            # get and reset counter
+            reply_count = thread['reply_count']
+            thread['reply_count'] = 0
+            if reply_count:
+                received.append('%s from %s' % (reply_count,thread_name))
+            else:
+                missing.append(thread_name)
             # get readings that are not accumulated from the LOOP packets
             # but by the thread itself
             # Note: This is done because some readings sent within the 
             #       LOOP packets get fixed or removed afterwards due
             #       to quality control.
             try:
-                reply = self.threads[thread_name]['thread'].get_archive_record(timespan)
+                reply = thread['thread'].get_archive_record(timespan)
                 if reply:
                     data = self._to_weewx(thread_name,reply,event.record['usUnits'])
                     event.record.update(data)
@@ -3206,9 +3415,15 @@ class PrecipData(StdService):
             except Exception as e:
                 #except (LookupError,ValueError,TypeError,ArithmeticError) as e:
                 logerr("Error reading archive record from thread '%s': %s %s traceback %s" % (thread_name,e.__class__.__name__,e,gettraceback(e)))
+        # log error if we did not receive any data from a device
+        if self.log_failure and missing:
+            logerr("no data received from %s during archive interval" % ', '.join(missing))
+        # log success to see that we are still receiving data
+        if self.log_success and received:
+            loginf("records received during archive interval: %s", ', '.join(received))
         # special accumulators
         event.record.update(self.old_accum)
-        self.old_accum = dict()
+        self.old_accum.clear()
         # thunderstorm
         if 'lightning_strike_count' in event.record and event.record['lightning_strike_count']>0:
             self.lightning_strike_ts = event.record.get('dateTime',time.time())
@@ -3252,7 +3467,7 @@ class PrecipData(StdService):
         self.is_freezing.del_outdated(ts)
         # debugging output
         if self.debug>1:
-            logdbg('temp5cm %s°C, temp2m %s°C, soil5cm %s°C isfreezing %s' % (self.temp5cm_C,self.temp2m_C,self.soil5cm_C,self.is_freezing))
+            logdbg('temp5cm %s°C, temp2m %s°C, soil5cm %s°C isfreezing %s', self.temp5cm_C,self.temp2m_C,self.soil5cm_C,self.is_freezing)
         # postprocess present weather
         # `ww`, `wawa`: most significant weather during the archive interval
         # `presentweatherWw`, `presentweatherWawa`: weather at the end of the archive interval
@@ -3269,23 +3484,39 @@ class PrecipData(StdService):
             loginf('new AWEKAS code %s' % self.old_awekas)
 
     def _to_weewx(self, thread_name, reply, usUnits):
-        data = dict()
+        convert = weewx.units.convertStd
+        # The units of the readings of a device do not change. So the
+        # conversion functions are looked up once only.
+        conversions = self.conversions.get((thread_name,usUnits))
+        if conversions is None:
+            conversions = self.conversions[(thread_name,usUnits)] = {}
+        data = {}
         for key in reply:
             #print('*',key)
-            if key in ('time','interval','count'):
+            if key in SKIP_KEYS: continue
+            val = reply[key]
+            if not isinstance(val,tuple):
+                # plain value
                 pass
-            elif key in ('interval','count'):
-                data[key] = reply[key]
+            elif len(val)<3 or val[0] is None:
+                # nothing to convert
+                val = val[0] if val else None
             else:
+                # value tuple
+                conv = conversions.get(key)
+                if conv is None or conv[0]!=val[1] or conv[1]!=val[2]:
+                    conv = (val[1],val[2],get_conversion(val,usUnits))
+                    conversions[key] = conv
                 try:
-                    val = reply[key]
-                    val = weewx.units.convertStd(val, usUnits)[0]
-                except (TypeError,ValueError,LookupError,ArithmeticError) as e:
-                    try:
-                        val = reply[key][0]
-                    except LookupError:
-                        val = None
-                data[key] = val
+                    if conv[2] is None:
+                        val = val[0]
+                    elif isinstance(val[0],(list,tuple)):
+                        val = convert(val, usUnits)[0]
+                    else:
+                        val = conv[2](val[0])
+                except (TypeError,ValueError,LookupError,ArithmeticError):
+                    val = val[0]
+            data[key] = val
         return data
 
 ##############################################################################
@@ -3311,7 +3542,16 @@ class PrecipArchive(StdService):
             self.log_success = True
             self.log_failure = True
         self.dbm = None
-        self.archive_interval = int(config_dict.get('StdArchive',configobj.ConfigObj()).get('archive_interval',300))
+        self.archive_interval = int(config_dict.get('StdArchive',EMPTY_CONF).get('archive_interval',300))
+        # Number of archive records to collect before writing them to
+        # the database in one transaction. With 1 (the default) every
+        # archive record is written immediately.
+        batch_size = config_dict.get('PrecipMeter',EMPTY_CONF).get('batch_size',1)
+        try:
+            self.batch_size = max(weeutil.weeutil.to_int(batch_size) or 1,1)
+        except (TypeError,ValueError) as e:
+            logerr("invalid batch_size %s: %s %s, using 1",batch_size,e.__class__.__name__,e)
+            self.batch_size = 1
         if 'PrecipMeter' in config_dict:
             if __name__!='__main__':
                 self.bind(weewx.NEW_LOOP_PACKET, self.new_loop_packet)
@@ -3341,6 +3581,10 @@ class PrecipArchive(StdService):
 
     def shutDown(self):
         """ close database """
+        try:
+            self.dbm_flush()
+        except Exception as e:
+            logerr('saving to database: %s %s' % (e.__class__.__name__,e))
         try:
             self.dbm_close()
         except Exception:
@@ -3366,6 +3610,7 @@ class PrecipArchive(StdService):
         """ open or create database """
         self.accumulator = None
         self.old_accumulator = None
+        self.pending = []
         self.dbm = None
         if not binding: 
             loginf("no database storage configured")
@@ -3393,6 +3638,13 @@ class PrecipArchive(StdService):
         if not self.accumulator:
             self.accumulator = self._new_accumulator(packet['dateTime'])
 
+        # Most packets are within the timespan of the current 
+        # accumulator. Add them without the exception machinery.
+        timespan = self.accumulator.timespan
+        if timespan.start<packet['dateTime']<=timespan.stop:
+            self.accumulator.addRecord(packet, add_hilo=True)
+            return
+
         # Try adding the LOOP packet to the existing accumulator. If the
         # timestamp is outside the timespan of the accumulator, an exception
         # will be thrown:
@@ -3407,12 +3659,34 @@ class PrecipArchive(StdService):
     
     def dbm_new_archive_record(self, record):
         """ add new archive record and update daily summary """
-        logdbg("dbm_new_archive_record frostIndicator %s %s" % ('frostIndicator' in record,record.get('frostIndicator')))
+        logdbg("dbm_new_archive_record frostIndicator %s %s", 'frostIndicator' in record,record.get('frostIndicator'))
         if self.dbm:
-            self.dbm.addRecord(record,
+            if self.batch_size<=1:
+                self.dbm.addRecord(record,
                            accumulator=self.old_accumulator,
                            log_success=self.log_success,
                            log_failure=self.log_failure)
+            else:
+                # (a copy, as the record may be changed by other
+                # services before it is written)
+                self.pending.append(dict(record))
+                if len(self.pending)>=self.batch_size:
+                    self.dbm_flush()
+    
+    def dbm_flush(self):
+        """ write the collected archive records in one transaction
+        
+            Note: The day summaries are updated from the archive records
+                  themselves in this case, as there is one LOOP 
+                  accumulator per archive record only. Records not
+                  flushed yet are lost if WeeWX is killed or crashes.
+        """
+        if self.dbm and self.pending:
+            pending = self.pending
+            self.pending = []
+            self.dbm.addRecord(pending,
+                           log_success=self.log_success,
+                           log_failure=self.log_failure)
     
     def _new_accumulator(self, timestamp):
         """ Copyright (C) Tom Keffer """